@@ -0,0 +1,126 @@
+import argparse
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# Compares two clustering runs by matching every hotspot centroid to its nearest
+# centroid in the other run. Centroids are turned into unit vectors so nearest
+# neighbours come from a matrix product computed in memory-bounded blocks
+# (largest dot product = smallest great circle distance), which handles full
+# national cluster sets in seconds.
+
+EARTH_RADIUS_MI = 3958.7613
+block_budget = 1 << 23  # dot products per block, 64MB of float64 whatever the size of the runs
+
+
+def load_clusters(path):
+    # handles both the records and the column-oriented json written by the clustering notebook
+    df = pd.read_json(path)
+    return df.reset_index(drop=True)
+
+
+def unit_vectors(lat, lon):
+    lat = np.radians(np.asarray(lat, dtype=float))
+    lon = np.radians(np.asarray(lon, dtype=float))
+    return np.column_stack((np.cos(lat) * np.cos(lon), np.cos(lat) * np.sin(lon), np.sin(lat)))
+
+
+def haversine_miles(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2.0 * EARTH_RADIUS_MI * np.arcsin(np.sqrt(a))
+
+
+def nearest_neighbors(src, ref, threshold_miles=None):
+    # Output: index into ref of the nearest centroid for each src centroid, the distance in miles
+    # and, if threshold_miles is given, the number of ref centroids within it of each src centroid
+    src_vec = unit_vectors(src['centroid_latitude'], src['centroid_longitude'])
+    ref_vec = unit_vectors(ref['centroid_latitude'], ref['centroid_longitude'])
+    index = np.empty(len(src_vec), dtype=int)
+    within = np.zeros(len(src_vec), dtype=int)
+    min_dot = None if threshold_miles is None else np.cos(threshold_miles / EARTH_RADIUS_MI)
+    chunk_size = max(1, block_budget // max(len(ref_vec), 1))
+
+    for start in range(0, len(src_vec), chunk_size):
+        block = src_vec[start:start + chunk_size] @ ref_vec.T
+        index[start:start + chunk_size] = block.argmax(axis=1)
+        if min_dot is not None:
+            within[start:start + chunk_size] = np.count_nonzero(block >= min_dot, axis=1)
+
+    # measure the matched distances with haversine, which is more precise than the dot product at short range
+    matched = ref.iloc[index]
+    distance = haversine_miles(src['centroid_latitude'].to_numpy(), src['centroid_longitude'].to_numpy(),
+                               matched['centroid_latitude'].to_numpy(), matched['centroid_longitude'].to_numpy())
+    return index, distance, within
+
+
+def distribution(values):
+    if len(values) == 0:
+        return None
+    return {
+        'mean': float(np.mean(values)),
+        'median': float(np.median(values)),
+        'p95': float(np.percentile(values, 95)),
+        'max': float(np.max(values)),
+    }
+
+
+def compare_clusters(baseline, candidate, threshold_miles=1.0):
+    # Output: dict with match rates in both directions, centroid drift and severity deltas for matched clusters
+    if len(baseline) == 0 or len(candidate) == 0:
+        raise ValueError("both clustering runs need at least one cluster")
+
+    start_time = time.time()
+    index, distance, within = nearest_neighbors(baseline, candidate, threshold_miles)
+    _, reverse_distance, _ = nearest_neighbors(candidate, baseline)
+    matched = distance <= threshold_miles
+
+    report = {
+        'baseline_clusters': len(baseline),
+        'candidate_clusters': len(candidate),
+        'threshold_miles': threshold_miles,
+        'matched': int(matched.sum()),
+        'match_rate': float(matched.mean()),
+        'reverse_match_rate': float((reverse_distance <= threshold_miles).mean()),
+        'pairs_within_threshold': int(within.sum()),
+        'drift_miles': distribution(distance[matched]),
+        'severity_delta': None,
+    }
+
+    if 'avg_severity' in baseline and 'avg_severity' in candidate:
+        delta = candidate['avg_severity'].to_numpy()[index[matched]] - baseline['avg_severity'].to_numpy()[matched]
+        report['severity_delta'] = distribution(delta)
+        if report['severity_delta'] is not None:
+            report['severity_delta']['mean_abs'] = float(np.mean(np.abs(delta)))
+
+    report['seconds'] = time.time() - start_time
+    return report
+
+
+def print_report(report):
+    print(f"Baseline clusters: {report['baseline_clusters']}, candidate clusters: {report['candidate_clusters']}")
+    print(f"Matched within {report['threshold_miles']} mi: {report['matched']} "
+          f"({round(report['match_rate'] * 100, 1)}%), reverse: {round(report['reverse_match_rate'] * 100, 1)}%")
+    print(f"Pairs within {report['threshold_miles']} mi: {report['pairs_within_threshold']}")
+    for name in ('drift_miles', 'severity_delta'):
+        if report[name] is not None:
+            print(f"{name}: " + ', '.join(f"{key} {round(value, 4)}" for key, value in report[name].items()))
+    print(f"Compared in {round(report['seconds'], 3)}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Compare two clustering runs by nearest centroid.')
+    parser.add_argument('baseline', help='hotspot json of the current clusters')
+    parser.add_argument('candidate', help='hotspot json of the new clusters')
+    parser.add_argument('--threshold', type=float, default=1.0, help='match distance in miles')
+    parser.add_argument('--min-match-rate', type=float, default=None,
+                        help='exit with status 1 if fewer than this fraction of baseline clusters match')
+    args = parser.parse_args()
+
+    report = compare_clusters(load_clusters(args.baseline), load_clusters(args.candidate), args.threshold)
+    print_report(report)
+    if args.min_match_rate is not None and report['match_rate'] < args.min_match_rate:
+        print(f"Match rate below {args.min_match_rate}, rejecting candidate clusters")
+        sys.exit(1)
@@ -0,0 +1,102 @@
+import hashlib
+import json
+import threading
+import time
+
+# Admission control for expensive requests. Identical requests that arrive while
+# one is already being computed wait for that result instead of redoing the work,
+# and at most maxConcurrent computations run at once. Requests that can't get a
+# slot before the deadline, or that arrive while the queue is full, get the
+# cheaper fallback result instead. A waiting duplicate gives up only once the
+# running request is past its own deadline plus the work timeout.
+
+FINGERPRINT_DECIMALS = 4 # ~11m, so near-identical routes share a fingerprint
+
+##
+# Builds a stable fingerprint for a /score-routes request body.
+#
+def routeFingerprint(data):
+	routes = [[(round(float(point[0]), FINGERPRINT_DECIMALS), round(float(point[1]), FINGERPRINT_DECIMALS)) for point in route] for route in data['routes']]
+	distances = [round(float(distance), 1) for distance in data['distances']]
+	return hashlib.sha1(json.dumps([routes, distances]).encode()).hexdigest()
+
+class Flight:
+	def __init__(self, expires):
+		self.done = threading.Event()
+		self.expires = expires # monotonic time after which duplicates stop waiting for this result
+		self.result = None
+		self.error = None
+
+class AdmissionController:
+	def __init__(self, maxConcurrent, maxQueued, deadline, workTimeout):
+		self.slots = threading.BoundedSemaphore(maxConcurrent)
+		self.maxQueued = maxQueued
+		self.deadline = deadline # seconds a request may wait for a slot
+		self.workTimeout = workTimeout # seconds duplicates wait for the running request's work once it has a slot
+		self.lock = threading.Lock()
+		self.inflight = {}
+		self.queued = 0
+		self.stats = { 'computed': 0, 'coalesced': 0, 'degraded': 0 }
+
+	def count(self, name):
+		with self.lock:
+			self.stats[name] += 1
+
+	##
+	# Runs work() for this key, or joins an identical request already running.
+	# Falls back to fallback() when past capacity or past the deadline.
+	#
+	def submit(self, key, work, fallback):
+		with self.lock:
+			flight = self.inflight.get(key)
+			leader = flight is None
+			if leader:
+				flight = Flight(time.monotonic() + self.deadline + self.workTimeout)
+				self.inflight[key] = flight
+
+		if not leader:
+			if flight.done.wait(max(flight.expires - time.monotonic(), 0)) and flight.error is None:
+				self.count('coalesced')
+				return flight.result
+			self.count('degraded')
+			return fallback()
+
+		try:
+			flight.result = self.run(work, fallback)
+			return flight.result
+		except Exception as err:
+			flight.error = err
+			raise
+		finally:
+			with self.lock:
+				del self.inflight[key]
+			flight.done.set()
+
+	def run(self, work, fallback):
+		# Only requests that actually have to wait for a slot count against the queue
+		acquired = self.slots.acquire(blocking=False)
+		if not acquired:
+			with self.lock:
+				full = self.queued >= self.maxQueued
+				if not full:
+					self.queued += 1
+			if full:
+				self.count('degraded')
+				return fallback()
+
+			acquired = self.slots.acquire(timeout=self.deadline)
+			with self.lock:
+				self.queued -= 1
+			if not acquired:
+				self.count('degraded')
+				return fallback()
+
+		try:
+			self.count('computed')
+			return work()
+		finally:
+			self.slots.release()
+
+	def report(self):
+		with self.lock:
+			return dict(self.stats, inflight=len(self.inflight), queued=self.queued)
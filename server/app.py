@@ -1,17 +1,33 @@
+import time
+processStartTime = time.time() # measured before the imports so cold start includes them
+
 from flask import Flask, request, jsonify
 from flask_cors import CORS, cross_origin
 from urllib.parse import urlparse
+from contextlib import contextmanager
+from psycopg2.pool import ThreadedConnectionPool
 import psycopg2
 import os
 import sys
-import time
+import threading
 
-from calculations import calculateSafetyScore, start_coord_one_call_API
+from calculations import calculateSafetyScore, cluster_route_score, get_current_conditions
+from admission import AdmissionController, routeFingerprint
+from warmup import WarmupState, startWarmUp
+from spatial import DEFAULT_RADIUS_M, DEFAULT_ACCIDENT_LIMIT, ClusterIndex, getRouteClass, routeToWKT, findAccidentsNear, findAccidentsAndClustersNear, findClustersNear
 
 # CONFIG VALUES
 columns = "*" # String describing which columns we want from every accident
-route_check_radius = '0.0001' # units are lat/lon
+route_check_radius = DEFAULT_RADIUS_M # units are meters
 connectCmd = f'dbname=**** user=*** host=***' #default
+pool_size = int(os.environ.get('DB_POOL_SIZE', 4)) # connections per worker process
+db_wait_timeout = float(os.environ.get('DB_WAIT_TIMEOUT', 10.0)) # seconds to wait for a free connection before answering 503
+scoring_concurrency = int(os.environ.get('SCORING_CONCURRENCY', pool_size)) # concurrent full scorings per worker, keep <= pool_size
+scoring_queue = int(os.environ.get('SCORING_QUEUE', 4 * scoring_concurrency)) # requests allowed to wait for a scoring slot
+scoring_deadline = float(os.environ.get('SCORING_DEADLINE', 2.0)) # seconds to wait before falling back to cluster-only scores
+scoring_work_timeout = float(os.environ.get('SCORING_WORK_TIMEOUT', 10.0)) # seconds identical requests wait on a running scoring
+cluster_index_refresh = float(os.environ.get('CLUSTER_INDEX_REFRESH', 60)) # seconds between checks for a refreshed clusters table
+degraded_weather_score = 0.5 # neutral 0-1 weather score used when the fallback can't compare against accident weather
 
 if (os.environ['DATABASE_URL']):
 	res = urlparse(os.environ['DATABASE_URL'])
@@ -20,42 +36,94 @@ if (os.environ['DATABASE_URL']):
 # Initialize the Flask object to attach our routes to
 app = Flask(__name__)
 
-# Connect to the PostgreSQL database
-conn = psycopg2.connect(connectCmd)
-cur = conn.cursor()
+# Connect to the PostgreSQL database. All connections are opened up front, and since the pool raises
+# instead of waiting when it runs dry, checkouts go through a semaphore of the same size.
+pool = ThreadedConnectionPool(pool_size, pool_size, connectCmd)
+connectionSlots = threading.BoundedSemaphore(pool_size)
+
+class DatabaseBusy(Exception):
+	pass
+
+class ScoringUnavailable(Exception):
+	pass
+
+##
+# Checks a connection out of the pool for the duration of a with block and yields a cursor on it.
+# Waits up to db_wait_timeout for a free connection, then raises DatabaseBusy.
+#
+@contextmanager
+def getCursor():
+	if not connectionSlots.acquire(timeout=db_wait_timeout):
+		raise DatabaseBusy(f"no database connection free after {db_wait_timeout}s")
+	try:
+		conn = pool.getconn()
+		try:
+			conn.autocommit = True
+			with conn.cursor() as cur:
+				yield cur
+		finally:
+			pool.putconn(conn, close=bool(conn.closed))
+	finally:
+		connectionSlots.release()
+
+# Bounds DB-heavy scoring and coalesces duplicate /score-routes requests
+admission = AdmissionController(scoring_concurrency, scoring_queue, scoring_deadline, scoring_work_timeout)
+
+##
+# Keeps the in-memory cluster index used for degraded scoring loaded, and reloads it when
+# the clusters table is replaced. Runs independently of warmup, retrying quickly until the first load.
+#
+clusterIndex = ClusterIndex()
+def refreshClusterIndex():
+	while True:
+		try:
+			with getCursor() as cur:
+				clusterIndex.refresh(cur)
+		except Exception as err:
+			print(f"[ClusterIndex] refresh failed: {err}")
+		time.sleep(cluster_index_refresh if clusterIndex.loaded else 5)
+threading.Thread(target=refreshClusterIndex, daemon=True).start()
+
+# Warm the pool, buffer cache and weather cache in the background; /ready reports when done
+warmupState = WarmupState(processStartTime)
+if os.environ.get('WARMUP', '1') != '0':
+	startWarmUp(warmupState, getCursor)
+else:
+	warmupState.ready = True
 
 # Setup CORS (security features)
 cors = CORS(app, origins=["http://localhost:3000", "https://safetyrouter.robbwdoering.com"])
 
-def getRouteCheckRadius(distance):
-	return '0.0001' if distance < 10 else '0.001'
+@app.errorhandler(DatabaseBusy)
+@app.errorhandler(ScoringUnavailable)
+def serviceBusy(err):
+	return jsonify({ 'error': str(err) }), 503
+
 ##
 # Gets a list of accidents along the given route.
 # NOTE: This isn't a request-able application route, just a utility function for other routes.
+# Input: route_check_radius is in meters, limit caps the number of accident rows returned,
+#   withAccidentClusters also collects the clusters of every accident along the route (only scoring needs them)
 # Output: A tuple:
-#   0 is a list of accident arrays, each containing all columns in order
+#   0 is a list of accident arrays, each containing all columns in order, nearest first and capped at limit
 #   1 is a list of cluster arrays of format [id, severity]
+#   2 is the uncapped list of (cluster, cluster severity) pairs of every accident along the route, None unless withAccidentClusters
 #
-def findIncidentsAlongRoute(route, route_check_radius):
+def findIncidentsAlongRoute(route, route_check_radius, limit=DEFAULT_ACCIDENT_LIMIT, withAccidentClusters=False):
 	if (route is None or len(route) == 0):
-		return []
+		return [[], [], [] if withAccidentClusters else None]
 	# Find the relevant accidents
-	multipoint = 'MULTIPOINT('
-	for point in route:
-		multipoint += f'{point[1]} {point[0]}, ' # reverse order - postgis wants lon before lat
-	multipoint = multipoint[:-2] + ')' # remove final comma, add closing paren
-
-	startProfileTime = time.time()
-	query = f"SELECT {columns} FROM accidents_table WHERE ST_DWithin(ST_GeomFromText('{multipoint}'), StartLoc, {route_check_radius})"
-	cur.execute(query)
-	accidents = cur.fetchall()
+	multipoint = routeToWKT(route)
+	accidentClusters = None
 
-	startProfileTime = time.time()
-	query = f"SELECT (cluster_id, severity) FROM clusters WHERE ST_DWithin(ST_GeomFromText('{multipoint}'), centroid, {route_check_radius})"
-	cur.execute(query)
-	clusters = cur.fetchall()
+	with getCursor() as cur:
+		if withAccidentClusters:
+			accidents, accidentClusters = findAccidentsAndClustersNear(cur, columns, multipoint, route_check_radius, limit)
+		else:
+			accidents = findAccidentsNear(cur, columns, multipoint, route_check_radius, limit)
+		clusters = findClustersNear(cur, multipoint, route_check_radius)
 
-	return [accidents, clusters]
+	return [accidents, clusters, accidentClusters]
 
 ## 
 # Takes in some routes as defined by lists of points along the route, and returns a "safety score" for each,
@@ -74,16 +142,24 @@ def scoreRoutes():
 		print("No data")
 		os.abort(401)
 
-	# Calculate and return scores
+	# Calculate and return scores, sharing work with identical in-flight requests
+	result = admission.submit(routeFingerprint(data), lambda: scoreRoutesFull(data), lambda: scoreRoutesClusterOnly(data))
+	return jsonify(result)
+
+##
+# Full scoring: weather, accidents and clusters along each route.
+#
+def scoreRoutesFull(data):
 	scores = []
 	allAccidents = []
-	current_conditions = start_coord_one_call_API(data['routes'][0][0][0], data['routes'][0][0][1])
+	current_conditions = get_current_conditions(data['routes'][0][0][0], data['routes'][0][0][1])
 	distances = data['distances']
 
 	for idx, route in enumerate(data['routes']):
 		# Fetch intersection accidents
 		score = 8.0 #No accident / hotspots along route
-		accidents, clusters = findIncidentsAlongRoute(route, getRouteCheckRadius(distances[idx]))
+		radius, limit = getRouteClass(distances[idx])
+		accidents, clusters, accidentClusters = findIncidentsAlongRoute(route, radius, limit, withAccidentClusters=True)
 
 		# Fetch population density 
 		# zipcode = accidents[0][11]
@@ -98,11 +174,30 @@ def scoreRoutes():
 		# 	density = density[0]
 
 		if len(accidents) > 0:
-			score = calculateSafetyScore(route, accidents, current_conditions, distances[idx])
+			score = calculateSafetyScore(route, accidents, current_conditions, distances[idx], clusters_with_severity=accidentClusters)
 		scores.append(score)
 		allAccidents.append(accidents)
 
-	return jsonify({ 'scores': scores, 'accidents': allAccidents, 'conditions': current_conditions })
+	return { 'scores': scores, 'accidents': allAccidents, 'conditions': current_conditions }
+
+##
+# Degraded scoring used past capacity: hotspots along each route from the in-memory cluster index,
+# no database queries and no weather call (cached weather is still returned if we have it).
+# The weather part of the score is the neutral midpoint, so scores stay on the same 0-10 scale.
+#
+def scoreRoutesClusterOnly(data):
+	if not clusterIndex.loaded:
+		raise ScoringUnavailable("server is over capacity and the cluster index is not loaded yet")
+
+	scores = []
+	distances = data['distances']
+	for idx, route in enumerate(data['routes']):
+		clusters = clusterIndex.near(route, getRouteClass(distances[idx])[0])
+		route_score, _, _ = cluster_route_score(clusters, distances[idx])
+		scores.append(8 * route_score + 2 * degraded_weather_score)
+
+	current_conditions = get_current_conditions(data['routes'][0][0][0], data['routes'][0][0][1], cached_only=True)
+	return { 'scores': scores, 'accidents': [[] for route in data['routes']], 'conditions': current_conditions, 'degraded': True }
 
 ## 
 # Accidents endpoint returns data for all the accidents found within a given area,
@@ -114,8 +209,9 @@ def accidentsCluster():
 	clusterId = request.json['clusterId']
 
 	query = 'SELECT * FROM accidents_table WHERE Cluster = %s'
-	cur.execute(query, (clusterId,))
-	accidents = cur.fetchall()
+	with getCursor() as cur:
+		cur.execute(query, (clusterId,))
+		accidents = cur.fetchall()
 
 	if (accidents is None):
 		os.abort(404)
@@ -139,8 +235,9 @@ def accidentsBox():
 	lngs.sort()
 
 	query = f'SELECT {columns} FROM accidents_table WHERE StartLoc && ST_MakeEnvelope({lngs[0]}, {lats[0]}, {lngs[1]}, {lats[1]}, 4326)'
-	cur.execute(query)
-	accidents = cur.fetchall()
+	with getCursor() as cur:
+		cur.execute(query)
+		accidents = cur.fetchall()
 
 	if (accidents is None):
 		os.abort(404)
@@ -156,10 +253,18 @@ def accidentsRoute():
 	if request.json is None or request.json['route'] is None:
 		os.abort(400)
 
-	accidents, clusters = findIncidentsAlongRoute(request.json['route'], route_check_radius)
+	accidents, clusters, _ = findIncidentsAlongRoute(request.json['route'], route_check_radius)
 
 	return jsonify({ 'accidents': accidents, 'clusters': clusters })
 
+## 
+# Readiness endpoint, only reports healthy once the startup warmup has finished without errors.
+# Output: 200 with the warmup report (step timings and cold start time) when warm, 503 while warming or if warmup failed
+@app.route("/ready")
+def ready():
+	report = dict(warmupState.report(), admission=admission.report(), clusterIndex={ 'loaded': clusterIndex.loaded, 'clusters': clusterIndex.size })
+	return jsonify(report), (200 if warmupState.healthy else 503)
+
 @app.route("/")
 def index():
 	return "CSE6242 Team 175 Backend - Frontend at https://safetyrouter.robbwdoering.com"
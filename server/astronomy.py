@@ -0,0 +1,94 @@
+import math
+import threading
+from datetime import date, datetime, timedelta, timezone
+from functools import lru_cache
+
+import pytz
+from suntime import Sun, SunTimeException
+
+# Lookup tables for the time-of-day and calendar features used in scoring.
+# Sunrise/sunset are precomputed for a whole year per grid cell the first time
+# a route starts in that cell, so scoring does an O(1) table lookup instead of
+# running the solar calculation on every request.
+
+sun_cell_size = 0.25  # degrees, sunrise moves ~1 minute per 0.25 degrees of longitude
+reference_year = 2020  # leap year, so Feb 29 gets a slot
+calendar_slots = 12 * 31
+
+sun_tables = {}
+sun_tables_lock = threading.Lock()
+
+# "day of year" ranges for the northern hemisphere, matching calculations.get_season
+spring = range(80, 172)
+summer = range(172, 264)
+fall = range(264, 355)
+# winter = everything else
+
+
+def season_for_doy(doy):
+    if doy in spring:
+        return (1, 0, 0)
+    elif doy in summer:
+        return (0, 1, 0)
+    elif doy in fall:
+        return (0, 0, 1)
+    else:  # in winter
+        return (0, 0, 0)
+
+
+# index 0 is unused so the table can be indexed directly by tm_yday (1-366)
+season_table = [season_for_doy(doy) for doy in range(367)]
+
+
+def season_vector(timestamp):
+    return list(season_table[timestamp.timetuple().tm_yday])
+
+
+@lru_cache(maxsize=None)
+def get_timezone(name):
+    return pytz.timezone(name)
+
+
+def calendar_slot(day):
+    return (day.month - 1) * 31 + (day.day - 1)
+
+
+def sun_cell(lat, lon):
+    return (round(float(lat) / sun_cell_size), round(float(lon) / sun_cell_size))
+
+
+def build_sun_table(cell):
+    # seconds from UTC midnight to sunrise/sunset for every calendar day, at the cell center.
+    # values can fall outside 0-86400 since suntime reports times on the UTC date it was asked about
+    sun = Sun(cell[0] * sun_cell_size, cell[1] * sun_cell_size)
+    table = [(math.nan, math.nan)] * calendar_slots
+    day = date(reference_year, 1, 1)
+    while day.year == reference_year:
+        midnight = datetime(day.year, day.month, day.day, tzinfo=timezone.utc)
+        try:
+            sunrise = (sun.get_sunrise_time(day) - midnight).total_seconds()
+            sunset = (sun.get_sunset_time(day) - midnight).total_seconds()
+        except SunTimeException:
+            sunrise, sunset = math.nan, math.nan  # polar day/night, treated as night
+        table[calendar_slot(day)] = (sunrise, sunset)
+        day += timedelta(days=1)
+    return table
+
+
+def get_sun_table(lat, lon):
+    cell = sun_cell(lat, lon)
+    table = sun_tables.get(cell)
+    if table is None:
+        table = build_sun_table(cell)
+        with sun_tables_lock:
+            sun_tables[cell] = table
+    return table
+
+
+def is_night(lat, lon, current_time):
+    # suntime uses the UTC date, so look up the slot for the UTC day of current_time
+    now_utc = current_time.astimezone(timezone.utc)
+    sunrise, sunset = get_sun_table(lat, lon)[calendar_slot(now_utc)]
+    since_midnight = now_utc.hour * 3600 + now_utc.minute * 60 + now_utc.second + now_utc.microsecond / 1e6
+    return 0 if sunrise < since_midnight < sunset else 1
+
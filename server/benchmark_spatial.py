@@ -0,0 +1,130 @@
+import argparse
+import json
+import math
+import os
+import random
+import time
+from urllib.parse import urlparse
+
+from spatial import ROUTE_CLASSES, ACCIDENT_GEOG, EARTH_RADIUS_M, METERS_PER_MILE, ClusterIndex, routeToWKT, findAccidentsNear, metersToDegrees
+
+# Benchmarks the route predicate across radii and latitudes. For each sample
+# route it compares the old planar-degree predicate against the geography
+# predicate and prints result-set size and query time.
+# With --clusters it runs without a database instead, counting the hotspots each
+# predicate reaches (the input of the cluster route score) from the hotspot json.
+# Usage: DATABASE_URL=... python benchmark_spatial.py [--repeats N]
+#        python benchmark_spatial.py --clusters accident_hotspots_updated.json
+
+# Sample routes at different latitudes, (name, lat, start lon)
+SAMPLE_ROUTES = [
+	("Miami", 25.77, -80.30),
+	("Houston", 29.76, -95.45),
+	("Atlanta", 33.75, -84.45),
+	("Denver", 39.74, -105.05),
+	("Chicago", 41.88, -87.75),
+	("Minneapolis", 44.98, -93.35),
+	("Seattle", 47.61, -122.40),
+]
+ROUTE_BEARINGS = [("east", math.pi / 2), ("north", 0.0)]
+ROUTE_MILES = [2, 20, 80]
+POINTS_PER_MILE = 10
+LEGACY_RADII = [0.0001, 0.001] # degrees, the old short/long route radii
+SAMPLED_ROUTES = 1000 # routes per length in --clusters mode, each starting at a random hotspot with a random bearing
+
+def buildRoute(lat, lon, miles, bearing):
+	count = max(int(miles * POINTS_PER_MILE), 2)
+	degLatPerMile, degLonPerMile = metersToDegrees(METERS_PER_MILE, lat)
+	step = miles / (count - 1)
+	return [[lat + i * step * degLatPerMile * math.cos(bearing), lon + i * step * degLonPerMile * math.sin(bearing)] for i in range(count)]
+
+##
+# The half width in meters, across a route with the given bearing, of a planar degree radius.
+# A degree circle is an ellipse on the ground: a full degree radius north-south, cos(lat) of it east-west.
+#
+def legacyWidth(radius, lat, bearing):
+	northSouth = math.radians(radius) * EARTH_RADIUS_M
+	eastWest = northSouth * math.cos(math.radians(lat))
+	return math.hypot(northSouth * math.sin(bearing), eastWest * math.cos(bearing))
+
+def timeQuery(fn, repeats):
+	best = math.inf
+	rows = 0
+	for _ in range(repeats):
+		start = time.time()
+		rows = len(fn())
+		best = min(best, time.time() - start)
+	return rows, best
+
+def benchmarkDatabase(repeats):
+	import psycopg2
+
+	res = urlparse(os.environ['DATABASE_URL'])
+	conn = psycopg2.connect(f'dbname={res.path[1:]} password={res.password} user={res.username} host={res.hostname} port={res.port}')
+	cur = conn.cursor()
+
+	def legacy(wkt, radius):
+		cur.execute(f"SELECT ID FROM accidents_table WHERE ST_DWithin(ST_GeomFromText('{wkt}'), StartLoc, {radius})")
+		return cur.fetchall()
+
+	print(f"{'route':<12}{'lat':>7}{'miles':>7} {'dir':<6} {'predicate':<22}{'rows':>8}{'ms':>10}")
+	for name, lat, lon in SAMPLE_ROUTES:
+		for miles in ROUTE_MILES:
+			for direction, bearing in ROUTE_BEARINGS:
+				wkt = routeToWKT(buildRoute(lat, lon, miles, bearing))
+
+				for radius in LEGACY_RADII:
+					rows, elapsed = timeQuery(lambda: legacy(wkt, radius), repeats)
+					print(f"{name:<12}{lat:>7.2f}{miles:>7} {direction:<6} {f'{radius}deg (~{legacyWidth(radius, lat, bearing):.0f}m)':<22}{rows:>8}{elapsed * 1000:>10.1f}")
+
+				for _, radius, limit in ROUTE_CLASSES:
+					rows, elapsed = timeQuery(lambda: findAccidentsNear(cur, 'ID', wkt, radius, limit), repeats)
+					print(f"{name:<12}{lat:>7.2f}{miles:>7} {direction:<6} {f'{radius}m (cap {limit})':<22}{rows:>8}{elapsed * 1000:>10.1f}")
+
+	cur.execute(f"EXPLAIN SELECT ID FROM accidents_table WHERE ST_DWithin({ACCIDENT_GEOG}, ST_GeogFromText(%s), %s)", (f'SRID=4326;{wkt}', ROUTE_CLASSES[0][1]))
+	print("\n".join(row[0] for row in cur.fetchall()))
+
+	cur.close()
+	conn.close()
+
+##
+# Counts the hotspots each predicate reaches on routes that start at random hotspots, which sit on roads.
+# The legacy radii are compared at their width across each route's bearing.
+#
+def benchmarkClusters(jsonPath, samples):
+	with open(jsonPath) as file:
+		clusters = json.load(file)
+	index = ClusterIndex()
+	index.load([(c['cluster_id'], c['centroid_latitude'], c['centroid_longitude'], c['avg_severity']) for c in clusters])
+	rng = random.Random(0)
+
+	radii = [f'{radius}deg' for radius in LEGACY_RADII] + [f'{radius}m' for _, radius, _ in ROUTE_CLASSES]
+	print(f"Hotspots reached per route, {samples} routes per length")
+	print(f"{'miles':>6}  {'predicate':<10}{'mean':>7}{'p95':>6}{'p99':>6}{'max':>6}")
+	for miles in ROUTE_MILES:
+		counts = { name: [] for name in radii }
+		for _ in range(samples):
+			start = rng.choice(clusters)
+			lat, lon, bearing = start['centroid_latitude'], start['centroid_longitude'], rng.uniform(0, 2 * math.pi)
+			route = buildRoute(lat, lon, miles, bearing)
+			for radius in LEGACY_RADII:
+				counts[f'{radius}deg'].append(len(index.near(route, legacyWidth(radius, lat, bearing))))
+			for _, radius, _ in ROUTE_CLASSES:
+				counts[f'{radius}m'].append(len(index.near(route, radius)))
+
+		for name in radii:
+			values = sorted(counts[name])
+			percentile = lambda p: values[min(len(values) - 1, int(p * len(values)))]
+			print(f"{miles:>6}  {name:<10}{sum(values) / len(values):>7.2f}{percentile(0.95):>6}{percentile(0.99):>6}{values[-1]:>6}")
+
+if __name__ == "__main__":
+	parser = argparse.ArgumentParser(description='Benchmark the route predicates across radii and latitudes.')
+	parser.add_argument('--repeats', type=int, default=3, help='runs per query, the fastest is reported')
+	parser.add_argument('--clusters', help='hotspot json, count hotspots reached instead of querying the database')
+	parser.add_argument('--samples', type=int, default=SAMPLED_ROUTES, help='routes per length in --clusters mode')
+	args = parser.parse_args()
+
+	if args.clusters:
+		benchmarkClusters(args.clusters, args.samples)
+	else:
+		benchmarkDatabase(args.repeats)
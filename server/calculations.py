@@ -1,18 +1,17 @@
 import sys
 import time
+import threading
 
 import requests
 import json
-import pandas as pd
 from datetime import datetime
 import math
 from statistics import mean
-from suntime import Sun
-import pytz
+from astronomy import get_timezone, is_night, season_vector
 # from IPython.display import Image, display
 
 
-def calculateSafetyScore(route, accidents, currentConditions, route_distance, options={}):
+def calculateSafetyScore(route, accidents, currentConditions, route_distance, options={}, clusters_with_severity=None):
     # double check that these values are accurate
     # accident data column numbers of interest:
     # 2  - time date
@@ -47,18 +46,8 @@ def calculateSafetyScore(route, accidents, currentConditions, route_distance, op
     current_weather = currentConditions["current"]
 
     # get local timezone and current time
-    local_timezone = accidents[0][13]
-    current_time = datetime.now(pytz.timezone(local_timezone)).astimezone()
-
-    # get sunrise and sunset time *** UTC ***
-    sun = Sun(float(route[0][0]), float(route[0][1]))
-    today_sr = sun.get_sunrise_time()
-    today_ss = sun.get_sunset_time()
-
-    # convert sunrise and sunset time to Local Timezone
-    # time_zone = options["current_time"].tzinfo
-    today_sr = today_sr.astimezone(pytz.timezone(local_timezone))
-    today_ss = today_ss.astimezone(pytz.timezone(local_timezone))
+    local_timezone = get_timezone(accidents[0][13])
+    current_time = datetime.now(local_timezone).astimezone()
 
     # build vector of current conditions
     current_conditions = []
@@ -70,22 +59,22 @@ def calculateSafetyScore(route, accidents, currentConditions, route_distance, op
     current_conditions.append(current_weather["Wind_Speed(mph)"]/max_wind)
     # 3 - Precipitation
     current_conditions.append((current_weather["Rain in last hr(in)"] + current_weather["Snow in last hr(in)"])/max_precip)
-    # 4 - night or day
-    if today_sr < current_time < today_ss:
-        current_conditions.append(0)
-    else:
-        current_conditions.append(1)
+    # 4 - night or day, from the precomputed sunrise/sunset table for the route start
+    current_conditions.append(is_night(route[0][0], route[0][1], current_time))
 
     # 5, 6, 7 - season
-    # needs to be passed in as a string so that the function can handle the accident data which is strings, not a python datetime class
-    current_conditions.extend(get_season(current_time.strftime("%a, %d %b %Y %H:%M:%S ")))
+    current_conditions.extend(season_vector(current_time))
 
     # create vector for accident conditions
     clean_data = []
     distance = []
-    clusters_with_severity = []
+    # clusters_with_severity can be passed in when accidents is a capped subset of the accidents along the route
+    collect_clusters = clusters_with_severity is None
+    if collect_clusters:
+        clusters_with_severity = []
     for index, row in enumerate(accidents):
-        clusters_with_severity.append((row[44],row[45]))
+        if collect_clusters:
+            clusters_with_severity.append((row[44],row[45]))
         clean_data.append([])
         # 0 - temp
         clean_data[index].append(row[40]/max_temp)
@@ -104,22 +93,12 @@ def calculateSafetyScore(route, accidents, currentConditions, route_distance, op
         # 4 - night or day
         clean_data[index].append(int(row[36]))
         # 5, 6, 7 - season
-        clean_data[index].extend(get_season(row[2].strftime("%a, %d %b %Y %H:%M:%S ")))
+        clean_data[index].extend(season_vector(row[2]))
 
         # Calculate the euclidean distance
         distance.append(math.dist(current_conditions, clean_data[index]))
 
-    clusters_with_severity = list(set(clusters_with_severity))
-    clusters = [x[0] for x in clusters_with_severity]
-    severity = [x[1] for x in clusters_with_severity]
-    clusters.remove(-1) if -1 in clusters else None
-    severity.remove(0.0) if 0 in severity else None
-    route_score = 1
-    avg_severity = 0.0
-    if len(clusters) != 0:
-        avg_severity = mean(severity) / max_severity
-        route_score = 1 - (len(clusters)/ route_distance * avg_severity)
-        route_score = 0 if route_score < 0 else route_score
+    route_score, clusters, avg_severity = cluster_route_score(clusters_with_severity, route_distance)
     # calculate safety score from euclidean distance
     # max distance is 3 so shift to 0-10 safety score range
     weather_score = mean(distance) /3
@@ -137,6 +116,24 @@ def calculateSafetyScore(route, accidents, currentConditions, route_distance, op
     return score
 
 
+def cluster_route_score(clusters_with_severity, route_distance):
+    # route score 0-1 from the hotspots along the route and their severity, 1 being no hotspots
+    max_severity = 4.0
+
+    clusters_with_severity = list(set(clusters_with_severity))
+    clusters = [x[0] for x in clusters_with_severity]
+    severity = [x[1] for x in clusters_with_severity]
+    clusters.remove(-1) if -1 in clusters else None
+    severity.remove(0.0) if 0 in severity else None
+    route_score = 1
+    avg_severity = 0.0
+    if len(clusters) != 0:
+        avg_severity = mean(severity) / max_severity
+        route_score = 1 - (len(clusters)/ route_distance * avg_severity)
+        route_score = 0 if route_score < 0 else route_score
+    return route_score, clusters, avg_severity
+
+
 # openweathermap API key
 api_key = "***"
 # unit conversions
@@ -145,6 +142,46 @@ m_to_mi = 0.000621371
 mm_to_in = 0.0393701
 
 
+# weather is cached per grid cell so nearby route origins share one API call
+weather_cell_size = 0.1  # degrees, ~11km
+weather_ttl = 600  # seconds
+weather_cache = {}
+weather_cache_lock = threading.Lock()
+weather_cache_purged = time.time()
+
+
+def weather_cell(lat, lon):
+    return (round(float(lat) / weather_cell_size), round(float(lon) / weather_cell_size))
+
+
+def get_current_conditions(start_lat_coord, start_long_coord, cached_only=False):
+    cell = weather_cell(start_lat_coord, start_long_coord)
+    with weather_cache_lock:
+        cached = weather_cache.get(cell)
+    if cached is not None and time.time() - cached[0] < weather_ttl:
+        return cached[1]
+    if cached_only:
+        return None
+
+    weather_output = start_coord_one_call_API(start_lat_coord, start_long_coord)
+    if weather_output is not None:
+        with weather_cache_lock:
+            weather_cache[cell] = (time.time(), weather_output)
+            purge_weather_cache()
+    return weather_output
+
+
+def purge_weather_cache():
+    # drops expired cells at most once per ttl, caller must hold weather_cache_lock
+    global weather_cache_purged
+    now = time.time()
+    if now - weather_cache_purged < weather_ttl:
+        return
+    for cell in [cell for cell, (fetched, _) in weather_cache.items() if now - fetched >= weather_ttl]:
+        del weather_cache[cell]
+    weather_cache_purged = now
+
+
 def start_coord_one_call_API(start_lat_coord, start_long_coord):
     # Current + Forecast data (+5 hourly/daily)
     weather_output = {}
@@ -1,6 +1,7 @@
 import pandas as pd
 import numpy as np
 from timezonefinder import TimezoneFinder
+from spatial_join import load_assignments, assign_clusters
 
 def run_file(path):
     df = pd.read_csv(path)
@@ -72,12 +73,10 @@ def data_preprocessing(df):
     data['Nautical_Twilight'] = data.apply(lambda row: row["Nautical_Twilight"] == "Day", axis=1)
     data['Astronomical_Twilight'] = data.apply(lambda row: row["Astronomical_Twilight"] == "Day", axis=1)
 
-    # Assign cluster to accident record
-    cluster_assignments = pd.read_csv('clust_assigns.csv')
-    # POINT(-105.0252 39.72929), 1249
-    data = pd.merge(data, cluster_assignments, on='StartLoc', how='left')
-    data['Cluster'] = data['Cluster'].fillna(-1)
-    data['Cluster'] = data['Cluster'].astype(int)
+    # Assign cluster to accident record, joined numerically on quantized lat/lon
+    cluster_assignments = load_assignments('clust_assigns.csv')
+    data['Cluster'], match_stats = assign_clusters(data['Start_Lat'], data['Start_Lng'], cluster_assignments)
+    print(f"[data_preprocessing] cluster match rate {match_stats['match_rate']:.4f} ({match_stats['exact']} exact, {match_stats['neighbour']} neighbour, {match_stats['unmatched']} unmatched)")
 
     # Assign cluster severity to accident record
     severity = pd.read_json('accident_hotspots_updated.json')
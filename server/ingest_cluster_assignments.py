@@ -1,40 +1,23 @@
-import pandas
 import time
-import json
 import csv
 
-total_accidents = 1178659 
-total_locations = 396771
-bin_size = 1000
+from spatial_join import build_assignments, precision
 
-# This file creates clust_assigns.csv which has Accident->Cluster mapping
+# This file creates clust_assigns.csv which has Accident->Cluster mapping.
+# Locations are stored as lat/lon quantized to integers (see spatial_join.py),
+# which data_cleaning.data_preprocessing joins against numerically.
 def main():
 	startTime = time.time()
 
-	with open('cluster_assignments_updated.json', newline='') as file:
-		with open('clust_assigns.csv', 'w') as outFile:
-			data = json.load(file)
-			writer = csv.writer(outFile)
-			writer.writerow(("StartLoc", "Cluster"))
-			locations = {}
-			count = 0
-			for cluster in data:
-				if (count == 0):
-					count += 1
-					continue
-				if count % 100000 == 0:
-					elapsed = time.time() - startTime
-					diff = total_accidents - count;
-					print(f"Locations - {count} in {elapsed}s, estimated remaining: {elapsed / count * (diff)}s")
-				count += 1
+	assignments, stats = build_assignments('cluster_assignments_updated.json')
+	print(f"Processed {stats['records']} in {stats['seconds']}s. Found {stats['locations']} unique locations")
+	print(f"Skipped {stats['malformed']} malformed records, {stats['conflicts']} locations had more than one cluster (first kept)")
 
-				# We speed this up by rounding to 5 places, AKA 1.1m
-				location = f"POINT({round(cluster['longitude'], 5)} {round(cluster['latitude'], 5)})"
+	with open('clust_assigns.csv', 'w', newline='') as outFile:
+		writer = csv.writer(outFile)
+		writer.writerow(("LatKey", "LonKey", "Cluster"))
+		for (latKey, lonKey), cluster in assignments.items():
+			writer.writerow((latKey, lonKey, cluster))
 
-				if (location not in locations):
-					locations[location] = (int(cluster['cluster_assignment']))
-			print(f"Processed {count} in {time.time() - startTime}s. Found {len(locations.keys())} unique locations")
-
-			for location in locations:
-				writer.writerow((location, locations[location]))
-main()
\ No newline at end of file
+	print(f"Wrote clust_assigns.csv at 1e-{precision} degree precision in {time.time() - startTime}s")
+main()
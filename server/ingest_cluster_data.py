@@ -1,8 +1,77 @@
 import psycopg2
+from psycopg2 import sql
+from psycopg2.extras import execute_values
 import sys
-import datetime
-import json
-import csv
+import time
+
+from spatial import CLUSTER_GEOG
+from spatial_join import iter_json_array
+
+batch_size = 1000
+lock_timeout = '5s' # give up on the swap rather than queue behind long readers
+
+# Cluster data is loaded into a staging table and indexed there, then swapped in
+# with renames inside one short transaction, so the live clusters table is
+# never empty or unindexed while clustering results are refreshed.
+STAGING_STATEMENTS = [
+	'DROP TABLE IF EXISTS clusters_staging',
+	'CREATE TABLE clusters_staging (cluster_id int PRIMARY KEY, centroid geometry, severity real)',
+]
+INDEX_STATEMENTS = [
+	'CREATE INDEX clusters_staging_centroid_idx ON clusters_staging USING GIST (centroid)',
+	f"CREATE INDEX clusters_staging_centroid_geog_idx ON clusters_staging USING GIST (({CLUSTER_GEOG}))",
+	'ANALYZE clusters_staging',
+]
+SWAP_STATEMENTS = [
+	f"SET LOCAL lock_timeout = '{lock_timeout}'",
+	'ALTER TABLE IF EXISTS clusters RENAME TO clusters_old',
+	'ALTER TABLE clusters_staging RENAME TO clusters',
+	'DROP TABLE IF EXISTS clusters_old',
+	'ALTER INDEX clusters_staging_pkey RENAME TO clusters_pkey',
+	'ALTER INDEX clusters_staging_centroid_idx RENAME TO clusters_centroid_idx',
+	'ALTER INDEX clusters_staging_centroid_geog_idx RENAME TO clusters_centroid_geog_idx',
+]
+# A plain insert: staging is created fresh on every run and swapped in whole, which already makes
+# re-running the load idempotent. Duplicate cluster ids in the json are resolved in loadStaging.
+INSERT = 'INSERT INTO clusters_staging (cluster_id, centroid, severity) VALUES %s'
+INSERT_TEMPLATE = '(%s, ST_GeomFromText(%s), %s)'
+
+def clusterRow(cluster):
+	return (int(cluster['cluster_id']), f"POINT({round(cluster['centroid_longitude'], 7)} {round(cluster['centroid_latitude'], 7)})", cluster['avg_severity'])
+
+##
+# Streams clusters from the hotspot json into the staging table in batches.
+# A cluster id that appears more than once in the json keeps its last entry.
+# Output: number of clusters loaded
+#
+def loadStaging(cur, jsonPath):
+	rows = {}
+	read = 0
+	for cluster in iter_json_array(jsonPath):
+		row = clusterRow(cluster)
+		rows[row[0]] = row
+		read += 1
+	if read > len(rows):
+		print(f"Found {read - len(rows)} duplicate cluster ids, keeping the last entry of each")
+
+	rows = list(rows.values())
+	for start in range(0, len(rows), batch_size):
+		execute_values(cur, INSERT, rows[start:start + batch_size], template=INSERT_TEMPLATE, page_size=batch_size)
+	return len(rows)
+
+##
+# Grants the live clusters table's privileges on the staging table too, since a renamed-in table doesn't inherit them.
+#
+def copyGrants(cur):
+	cur.execute('''SELECT grantee, privilege_type FROM information_schema.role_table_grants
+		WHERE table_schema = current_schema() AND table_name = 'clusters' AND grantee <> current_user''')
+	for grantee, privilege in cur.fetchall():
+		role = sql.SQL('PUBLIC') if grantee == 'PUBLIC' else sql.Identifier(grantee)
+		cur.execute(sql.SQL('GRANT {} ON clusters_staging TO {}').format(sql.SQL(privilege), role))
+
+def executeAll(cur, statements):
+	for statement in statements:
+		cur.execute(statement)
 
 # This file reads in cluster data into a SQL table
 def main():
@@ -15,20 +84,36 @@ def main():
 
 	conn = psycopg2.connect(f'dbname={database} user={user} host={host} port={port} password={password}')
 	cur = conn.cursor()
+	startTime = time.time()
 
-	with open(jsonPath, newline='') as file:
-		data = json.load(file)
-
-		query = 'INSERT INTO clusters (cluster_id, centroid, severity) VALUES'
-		for cluster in data:
-			query += f" ({cluster['cluster_id']}, 'POINT({round(cluster['centroid_longitude'], 7)} {round(cluster['centroid_latitude'], 7)})', {cluster['avg_severity']}),"
-		query = query[:-1] + ';'
-		# print(query)
-		cur.execute(query)
+	failed = False
+	try:
+		executeAll(cur, STAGING_STATEMENTS)
+		count = loadStaging(cur, jsonPath)
+		executeAll(cur, INDEX_STATEMENTS)
+		conn.commit()
+		print(f"Staged {count} clusters in {time.time() - startTime}s")
 
+		swapTime = time.time()
+		copyGrants(cur)
+		executeAll(cur, SWAP_STATEMENTS)
 		conn.commit()
+		print(f"Swapped clusters table in {time.time() - swapTime}s")
+	except (Exception, psycopg2.DatabaseError) as error:
+		print("Error: %s" % error)
+		conn.rollback()
+		failed = True
+		# Don't leave a half-loaded staging table behind, the live clusters table is untouched
+		try:
+			cur.execute('DROP TABLE IF EXISTS clusters_staging')
+			conn.commit()
+		except psycopg2.DatabaseError as dropError:
+			print("Error dropping clusters_staging: %s" % dropError)
+	finally:
+		cur.close()
+		conn.close()
 
-	cur.close()
-	conn.close()
+	if failed:
+		sys.exit(1)
 
-main()
\ No newline at end of file
+main()
@@ -0,0 +1,98 @@
+import argparse
+import random
+import threading
+import time
+import requests
+
+# Load generator for /score-routes. Ramps the number of concurrent clients and
+# prints throughput, latency percentiles and the share of degraded responses at
+# each step, to check that p99 stays bounded past saturation.
+# Usage: python load_test.py [--url http://localhost:5000] [--levels 1,2,4,8,16,32,64] [--duration 20]
+
+# Origins the sample routes start from, (lat, lon)
+ORIGINS = [
+	(33.749, -84.388),
+	(39.739, -104.990),
+	(41.878, -87.630),
+	(29.760, -95.370),
+	(47.606, -122.332),
+]
+
+def buildRoute(lat, lon, miles, heading):
+	# A straight route as a list of [lat, lon] points, roughly 10 points per mile
+	count = max(int(miles * 10), 2)
+	step = miles / 69.0 / (count - 1)
+	return [[lat + i * step * heading[0], lon + i * step * heading[1]] for i in range(count)]
+
+def buildRequests(distinct):
+	payloads = []
+	for i in range(distinct):
+		lat, lon = ORIGINS[i % len(ORIGINS)]
+		miles = [3, 12, 40][i % 3]
+		heading = [(1, 0), (0, 1), (-1, 0), (0, -1)][i // len(ORIGINS) % 4]
+		route = buildRoute(lat, lon, miles, heading)
+		payloads.append({ 'routes': [route], 'distances': [miles] })
+	return payloads
+
+def percentile(values, pct):
+	if not values:
+		return float('nan')
+	values = sorted(values)
+	return values[min(len(values) - 1, int(len(values) * pct / 100))]
+
+def runLevel(url, payloads, clients, duration, timeout):
+	latencies = []
+	counts = { 'ok': 0, 'degraded': 0, 'errors': 0 }
+	lock = threading.Lock()
+	stopAt = time.time() + duration
+
+	def client():
+		session = requests.Session()
+		while time.time() < stopAt:
+			payload = random.choice(payloads)
+			start = time.time()
+			try:
+				response = session.post(f'{url}/score-routes', json=payload, timeout=timeout)
+				elapsed = time.time() - start
+				body = response.json() if response.ok else None
+				with lock:
+					latencies.append(elapsed)
+					if body is None:
+						counts['errors'] += 1
+					elif body.get('degraded'):
+						counts['degraded'] += 1
+					else:
+						counts['ok'] += 1
+			except (requests.RequestException, ValueError):
+				with lock:
+					latencies.append(time.time() - start)
+					counts['errors'] += 1
+
+	threads = [threading.Thread(target=client) for _ in range(clients)]
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+
+	total = len(latencies)
+	print(f"{clients:>8}{total / duration:>8.1f}{percentile(latencies, 50) * 1000:>9.0f}{percentile(latencies, 95) * 1000:>9.0f}"
+		f"{percentile(latencies, 99) * 1000:>9.0f}{100 * counts['degraded'] / max(total, 1):>10.1f}{counts['errors']:>8}")
+
+def main():
+	parser = argparse.ArgumentParser(description='Ramp concurrent load against /score-routes.')
+	parser.add_argument('--url', default='http://localhost:5000')
+	parser.add_argument('--levels', default='1,2,4,8,16,32,64', help='comma separated client counts')
+	parser.add_argument('--duration', type=float, default=20, help='seconds per level')
+	parser.add_argument('--distinct', type=int, default=10, help='number of distinct routes, fewer means more duplicates')
+	parser.add_argument('--timeout', type=float, default=30)
+	args = parser.parse_args()
+
+	payloads = buildRequests(args.distinct)
+	print(f"{'clients':>8}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'degraded%':>10}{'errors':>8}")
+	for clients in [int(level) for level in args.levels.split(',')]:
+		runLevel(args.url, payloads, clients, args.duration, args.timeout)
+
+	print(requests.get(f'{args.url}/ready').json())
+
+if __name__ == "__main__":
+	main()
@@ -0,0 +1,209 @@
+import math
+
+# Spatial predicates for matching accidents and hotspots to a route.
+# All radii are in meters: points are cast to PostGIS geography, so the match
+# width is the same in Florida as it is in Montana (a degree of longitude is
+# ~96km at 30N but only ~79km at 45N).
+
+EARTH_RADIUS_M = 6371008.8
+METERS_PER_MILE = 1609.344
+
+# Route classes as (max route length in miles, check radius in meters, row cap).
+# The radii are the old 0.0001 and 0.001 degree widths in meters, which keeps the hotspots each route
+# is scored on where they were (see benchmark_spatial.py --clusters) without the latitude dependence.
+# The caps only bound the accident rows sent back per route, scoring reads every matched cluster.
+ROUTE_CLASSES = [
+	(10, 10, 5000),
+	(math.inf, 100, 10000),
+]
+DEFAULT_RADIUS_M = ROUTE_CLASSES[0][1]
+DEFAULT_ACCIDENT_LIMIT = ROUTE_CLASSES[0][2]
+CLUSTER_LIMIT = 1000
+
+# The geometry columns are stored without an SRID, so the geography expression
+# pins them to WGS84. The query text has to match these index expressions
+# exactly for the planner to use them.
+ACCIDENT_GEOG = 'ST_SetSRID(StartLoc, 4326)::geography'
+CLUSTER_GEOG = 'ST_SetSRID(centroid, 4326)::geography'
+
+INDEX_STATEMENTS = [
+	f'CREATE INDEX IF NOT EXISTS accidents_startloc_geog_idx ON accidents_table USING GIST (({ACCIDENT_GEOG}))',
+	f'CREATE INDEX IF NOT EXISTS clusters_centroid_geog_idx ON clusters USING GIST (({CLUSTER_GEOG}))',
+	'ANALYZE accidents_table',
+	'ANALYZE clusters',
+]
+
+##
+# Picks the route class for a route of the given length.
+# Output: A tuple of (radius in meters, max accident rows)
+#
+def getRouteClass(distance):
+	for maxMiles, radius, limit in ROUTE_CLASSES:
+		if distance < maxMiles:
+			return (radius, limit)
+	return ROUTE_CLASSES[-1][1:]
+
+##
+# Builds a WKT multipoint from a list of [lat, lon] points.
+# NOTE: postgis wants lon before lat
+#
+def routeToWKT(route):
+	return 'MULTIPOINT(' + ', '.join(f'{float(point[1])} {float(point[0])}' for point in route) + ')'
+
+##
+# Finds accidents within radius meters of any point on the route, nearest first, capped at limit rows.
+# NOTE: the cap only bounds the rows sent back to the client, use findAccidentsAndClustersNear for scoring
+#
+def findAccidentsNear(cur, columns, wkt, radius, limit=DEFAULT_ACCIDENT_LIMIT):
+	route = f'SRID=4326;{wkt}'
+	query = f"SELECT {columns} FROM accidents_table WHERE ST_DWithin({ACCIDENT_GEOG}, ST_GeogFromText(%s), %s) ORDER BY ST_Distance({ACCIDENT_GEOG}, ST_GeogFromText(%s)) LIMIT %s"
+	cur.execute(query, (route, radius, route, limit + 1))
+	return capAccidents(cur.fetchall(), limit)
+
+def capAccidents(accidents, limit):
+	if len(accidents) > limit:
+		print(f"[findAccidentsNear] route matched more than {limit} accidents, returning the nearest {limit}")
+		accidents = accidents[:limit]
+	return accidents
+
+##
+# Same as findAccidentsNear, but also collects the distinct clusters of every matched accident, uncapped,
+# in the same statement so the accident scan only runs once.
+# Output: A tuple:
+#   0 is the list of accident rows, nearest first and capped at limit
+#   1 is the list of (cluster id, cluster severity) pairs, the same pairs calculateSafetyScore reads from accident rows
+#
+def findAccidentsAndClustersNear(cur, columns, wkt, radius, limit=DEFAULT_ACCIDENT_LIMIT):
+	route = f'SRID=4326;{wkt}'
+	# matched is referenced twice, so postgres materializes it and the index scan runs once.
+	# pairs always returns one row (NULL when nothing matched), nearest adds the accident columns to it.
+	query = f"""WITH matched AS (
+			SELECT {columns}, Cluster AS match_cluster, cluster_severity AS match_severity, ST_Distance({ACCIDENT_GEOG}, ST_GeogFromText(%s)) AS match_distance
+			FROM accidents_table WHERE ST_DWithin({ACCIDENT_GEOG}, ST_GeogFromText(%s), %s)
+		), pairs AS (
+			SELECT json_agg(json_build_array(match_cluster, match_severity)) AS pairs
+			FROM (SELECT DISTINCT match_cluster, match_severity FROM matched) distinct_pairs
+		), nearest AS (
+			SELECT * FROM matched ORDER BY match_distance LIMIT %s
+		)
+		SELECT nearest.*, pairs.pairs FROM pairs LEFT JOIN nearest ON true ORDER BY nearest.match_distance"""
+	cur.execute(query, (route, route, radius, limit + 1))
+	rows = cur.fetchall()
+	if len(rows) == 0 or rows[0][-1] is None:
+		return ([], [])
+	pairs = [(cluster, severity) for cluster, severity in rows[0][-1]]
+	# Drop match_cluster, match_severity, match_distance and pairs
+	return (capAccidents([row[:-4] for row in rows], limit), pairs)
+
+##
+# Finds clusters whose centroid is within radius meters of any point on the route.
+# Output: list of rows of format [(id, severity)]
+#
+def findClustersNear(cur, wkt, radius, limit=CLUSTER_LIMIT):
+	query = f"SELECT (cluster_id, severity) FROM clusters WHERE ST_DWithin({CLUSTER_GEOG}, ST_GeogFromText(%s), %s) LIMIT %s"
+	cur.execute(query, (f'SRID=4326;{wkt}', radius, limit))
+	return cur.fetchall()
+
+##
+# Builds the geography indexes the predicates above rely on. Safe to re-run.
+#
+def createSpatialIndexes(cur):
+	for statement in INDEX_STATEMENTS:
+		print(statement)
+		cur.execute(statement)
+
+##
+# Converts a radius in meters to the equivalent planar degree offsets at a latitude.
+# Output: A tuple of (degrees of latitude, degrees of longitude)
+#
+def metersToDegrees(radius, lat):
+	degLat = math.degrees(radius / EARTH_RADIUS_M)
+	degLon = degLat / max(math.cos(math.radians(lat)), 1e-12)
+	return (degLat, degLon)
+
+##
+# Great circle distance between two lat/lon points, in meters.
+#
+def haversineMeters(lat1, lon1, lat2, lon2):
+	lat1, lon1, lat2, lon2 = map(math.radians, (lat1, lon1, lat2, lon2))
+	a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+	return 2 * EARTH_RADIUS_M * math.asin(math.sqrt(a))
+
+##
+# In-memory grid of cluster centroids, used to score routes without touching the database.
+# A cluster matches a route point when the point is within the route radius of the cluster's extent,
+# a circle of CLUSTER_EXTENT_M around the centroid, which approximates "an accident of this cluster is
+# within the radius of the route" that the full score counts.
+#
+class ClusterIndex:
+	CELL_SIZE = 0.01 # degrees, ~1.1km of latitude
+	CLUSTER_EXTENT_M = 400 # DBSCAN eps used to build the clusters (0.4km, see dbscan_accident_clustering.ipynb)
+
+	def __init__(self):
+		self.cells = {}
+		self.size = 0
+		self.loaded = False
+		self.tableOid = None
+
+	def cell(self, lat, lon):
+		return (math.floor(lat / self.CELL_SIZE), math.floor(lon / self.CELL_SIZE))
+
+	##
+	# Replaces the index contents with rows of (cluster_id, lat, lon, severity).
+	#
+	def load(self, rows):
+		cells = {}
+		for clusterId, lat, lon, severity in rows:
+			cells.setdefault(self.cell(lat, lon), []).append((clusterId, lat, lon, severity))
+		self.cells = cells
+		self.size = len(rows)
+		self.loaded = True
+
+	##
+	# Reloads the index if the clusters table was replaced since the last load (ingest_cluster_data.py swaps
+	# in a new table, which changes its oid). Cheap to call often.
+	# Output: True if the index was reloaded
+	#
+	def refresh(self, cur):
+		cur.execute("SELECT 'clusters'::regclass::oid")
+		tableOid = cur.fetchone()[0]
+		if self.loaded and tableOid == self.tableOid:
+			return False
+		cur.execute('SELECT cluster_id, ST_Y(centroid), ST_X(centroid), severity FROM clusters')
+		self.load(cur.fetchall())
+		self.tableOid = tableOid
+		print(f"[ClusterIndex] loaded {self.size} clusters")
+		return True
+
+	##
+	# Finds clusters whose extent is within radius meters of any point on the route.
+	# Output: list of (id, severity) tuples
+	#
+	def near(self, route, radius):
+		cells = self.cells
+		reach = radius + self.CLUSTER_EXTENT_M
+		found = {}
+		for point in route:
+			lat, lon = float(point[0]), float(point[1])
+			cellLat, cellLon = self.cell(lat, lon)
+			degLat, degLon = metersToDegrees(reach, lat)
+			ringLat, ringLon = math.ceil(degLat / self.CELL_SIZE), math.ceil(degLon / self.CELL_SIZE)
+			for dLat in range(-ringLat, ringLat + 1):
+				for dLon in range(-ringLon, ringLon + 1):
+					for clusterId, cLat, cLon, severity in cells.get((cellLat + dLat, cellLon + dLon), ()):
+						if clusterId not in found and haversineMeters(lat, lon, cLat, cLon) <= reach:
+							found[clusterId] = severity
+		return list(found.items())
+
+if __name__ == "__main__":
+	import os
+	from urllib.parse import urlparse
+	import psycopg2
+
+	res = urlparse(os.environ['DATABASE_URL'])
+	conn = psycopg2.connect(f'dbname={res.path[1:]} password={res.password} user={res.username} host={res.hostname} port={res.port}')
+	conn.autocommit = True
+	cur = conn.cursor()
+	createSpatialIndexes(cur)
+	cur.close()
+	conn.close()
@@ -0,0 +1,137 @@
+import json
+import re
+import time
+
+import numpy as np
+import pandas as pd
+
+# Numeric spatial join between accidents and their DBSCAN cluster assignments.
+# Locations are keyed on lat/lon quantized to integers (5 decimal places, ~1.1m)
+# and packed into a single int64, so the join is an integer hash lookup rather
+# than a merge on formatted POINT(...) strings. Points that land just across a
+# quantization boundary are matched to the nearest of the 8 neighbouring keys.
+
+precision = 5
+scale = 10 ** precision
+lat_offset = 1 << 24  # |lat| * 1e5 <= 9e6 < 2^24
+lon_offset = 1 << 25  # |lon| * 1e5 <= 1.8e7 < 2^25
+lon_bits = 26
+neighbours = [(dlat, dlon) for dlat in (-1, 0, 1) for dlon in (-1, 0, 1) if dlat or dlon]
+
+skip_separators = re.compile(r'[\s,]*')
+
+
+def quantize(value):
+    return int(round(float(value) * scale))
+
+
+def location_key(lat_q, lon_q):
+    return ((lat_q + lat_offset) << lon_bits) + lon_q + lon_offset
+
+
+def location_keys(lats, lons):
+    # vectorized location_key for whole columns, returns (keys, valid mask, offset of each point from its key in quanta)
+    lats = pd.to_numeric(pd.Series(lats), errors='coerce').to_numpy(dtype=float)
+    lons = pd.to_numeric(pd.Series(lons), errors='coerce').to_numpy(dtype=float)
+    valid = ~(np.isnan(lats) | np.isnan(lons))
+    lat_scaled = np.where(valid, lats, 0) * scale
+    lon_scaled = np.where(valid, lons, 0) * scale
+    lat_q = np.rint(lat_scaled).astype(np.int64)
+    lon_q = np.rint(lon_scaled).astype(np.int64)
+    # longitude quanta shrink with latitude, so scale the east-west offset to compare distances
+    residual = (lat_scaled - lat_q, (lon_scaled - lon_q) * np.cos(np.radians(np.where(valid, lats, 0))))
+    return ((lat_q + lat_offset) << lon_bits) + lon_q + lon_offset, valid, residual
+
+
+def lats_of(keys):
+    # latitude in degrees of packed location keys
+    return ((keys >> lon_bits) - lat_offset) / scale
+
+
+def iter_json_array(path, chunk_size=1 << 20):
+    # yields the elements of a top level JSON array one at a time without loading the whole file
+    decoder = json.JSONDecoder()
+    with open(path) as file:
+        buffer = file.read(chunk_size).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f"{path} is not a JSON array")
+        pos = 1
+        while True:
+            pos = skip_separators.match(buffer, pos).end()
+            if buffer.startswith(']', pos):
+                return
+            try:
+                obj, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                chunk = file.read(chunk_size)
+                if not chunk:
+                    raise
+                buffer = buffer[pos:] + chunk
+                pos = 0
+                continue
+            yield obj
+
+
+def build_assignments(path):
+    # Output: dict of (lat_q, lon_q) -> cluster and a stats dict. The first assignment seen for a location wins
+    start_time = time.time()
+    assignments = {}
+    stats = {'records': 0, 'malformed': 0, 'conflicts': 0}
+    for record in iter_json_array(path):
+        stats['records'] += 1
+        try:
+            location = (quantize(record['latitude']), quantize(record['longitude']))
+            cluster = int(record['cluster_assignment'])
+        except (KeyError, TypeError, ValueError):
+            stats['malformed'] += 1
+            continue
+
+        existing = assignments.setdefault(location, cluster)
+        if existing != cluster:
+            stats['conflicts'] += 1
+        if stats['records'] % 100000 == 0:
+            print(f"Assignments - {stats['records']} in {time.time() - start_time}s")
+
+    stats['locations'] = len(assignments)
+    stats['seconds'] = time.time() - start_time
+    return assignments, stats
+
+
+def load_assignments(path):
+    # reads the csv written by ingest_cluster_assignments.py into a key -> cluster lookup series
+    assignments = pd.read_csv(path, dtype={'LatKey': np.int64, 'LonKey': np.int64, 'Cluster': np.int64})
+    keys = ((assignments['LatKey'].to_numpy() + lat_offset) << lon_bits) + assignments['LonKey'].to_numpy() + lon_offset
+    lookup = pd.Series(assignments['Cluster'].to_numpy(), index=keys)
+    return lookup[~lookup.index.duplicated()]
+
+
+def assign_clusters(lats, lons, lookup):
+    # Output: int array of cluster ids (-1 when unmatched) and a stats dict with the match rate
+    keys, valid, (lat_residual, lon_residual) = location_keys(lats, lons)
+    clusters = np.where(valid, lookup.reindex(keys).to_numpy(dtype=float), np.nan)
+    exact = int(np.count_nonzero(~np.isnan(clusters)))
+
+    # unmatched points take the cluster of the nearest neighbouring key that has one
+    missing = np.flatnonzero(np.isnan(clusters) & valid)
+    if len(missing):
+        best = np.full(len(missing), np.nan)
+        best_distance = np.full(len(missing), np.inf)
+        cos_lat = np.cos(np.radians(lats_of(keys[missing])))
+        for dlat, dlon in neighbours:
+            found = lookup.reindex(keys[missing] + (dlat << lon_bits) + dlon).to_numpy(dtype=float)
+            distance = (lat_residual[missing] - dlat) ** 2 + (lon_residual[missing] - dlon * cos_lat) ** 2
+            closer = ~np.isnan(found) & (distance < best_distance)
+            best[closer] = found[closer]
+            best_distance[closer] = distance[closer]
+        clusters[missing] = best
+
+    matched = int(np.count_nonzero(~np.isnan(clusters)))
+    total = len(clusters)
+    stats = {
+        'rows': total,
+        'exact': exact,
+        'neighbour': matched - exact,
+        'unmatched': total - matched,
+        'match_rate': matched / total if total else 1.0,
+    }
+    return np.nan_to_num(clusters, nan=-1).astype(int), stats
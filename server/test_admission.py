@@ -0,0 +1,115 @@
+import threading
+import time
+
+from admission import AdmissionController, routeFingerprint
+
+
+def slow_work(started, seconds, result="full"):
+    def work():
+        started.set()
+        time.sleep(seconds)
+        return result
+    return work
+
+
+def fallback():
+    return "fb"
+
+
+def run_in_thread(fn):
+    results = []
+    thread = threading.Thread(target=lambda: results.append(fn()))
+    thread.start()
+    return thread, results
+
+
+def test_duplicate_waits_for_work_longer_than_the_deadline():
+    admission = AdmissionController(1, 1, 0.3, 5.0)
+    started = threading.Event()
+    leader, leader_result = run_in_thread(lambda: admission.submit("route", slow_work(started, 0.5), fallback))
+    started.wait()
+
+    assert admission.submit("route", lambda: "duplicate computed", fallback) == "full"
+    leader.join()
+    assert leader_result == ["full"]
+    assert admission.report() == { 'computed': 1, 'coalesced': 1, 'degraded': 0, 'inflight': 0, 'queued': 0 }
+
+
+def test_duplicate_falls_back_past_the_running_request_deadline_and_work_timeout():
+    admission = AdmissionController(1, 1, 0.1, 0.1)
+    started = threading.Event()
+    leader, _ = run_in_thread(lambda: admission.submit("route", slow_work(started, 0.5), fallback))
+    started.wait()
+
+    start = time.monotonic()
+    assert admission.submit("route", lambda: "duplicate computed", fallback) == "fb"
+    assert time.monotonic() - start < 0.4
+    leader.join()
+    assert admission.report()['degraded'] == 1
+
+
+def test_free_slot_runs_without_queueing():
+    admission = AdmissionController(1, 0, 0.1, 0.1)
+    assert admission.submit("route", lambda: "full", fallback) == "full"
+    assert admission.report()['computed'] == 1
+
+
+def test_full_queue_falls_back_immediately():
+    admission = AdmissionController(1, 0, 5.0, 5.0)
+    started = threading.Event()
+    leader, _ = run_in_thread(lambda: admission.submit("first", slow_work(started, 0.3), fallback))
+    started.wait()
+
+    start = time.monotonic()
+    assert admission.submit("second", lambda: "full", fallback) == "fb"
+    assert time.monotonic() - start < 0.2
+    leader.join()
+
+
+def test_queued_request_falls_back_after_the_deadline():
+    admission = AdmissionController(1, 1, 0.1, 5.0)
+    started = threading.Event()
+    leader, _ = run_in_thread(lambda: admission.submit("first", slow_work(started, 0.5), fallback))
+    started.wait()
+
+    assert admission.submit("second", lambda: "full", fallback) == "fb"
+    leader.join()
+    assert admission.report() == { 'computed': 1, 'coalesced': 0, 'degraded': 1, 'inflight': 0, 'queued': 0 }
+
+
+def test_duplicate_falls_back_when_the_running_request_fails():
+    admission = AdmissionController(1, 1, 0.1, 5.0)
+    started = threading.Event()
+    release = threading.Event()
+
+    def failing_work():
+        started.set()
+        release.wait()
+        raise RuntimeError("database down")
+
+    errors = []
+    def lead():
+        try:
+            admission.submit("route", failing_work, fallback)
+        except RuntimeError as err:
+            errors.append(err)
+
+    leader = threading.Thread(target=lead)
+    leader.start()
+    started.wait()
+    follower, follower_result = run_in_thread(lambda: admission.submit("route", lambda: "full", fallback))
+    time.sleep(0.05)
+    release.set()
+    leader.join()
+    follower.join()
+
+    assert len(errors) == 1
+    assert follower_result == ["fb"]
+
+
+def test_route_fingerprint_ignores_differences_below_its_rounding():
+    route = { 'routes': [[[41.88001, -87.63001], [41.89, -87.64]]], 'distances': [1.04] }
+    nearby = { 'routes': [[[41.880012, -87.630008], [41.89, -87.64]]], 'distances': [1.01] }
+    other = { 'routes': [[[41.88, -87.63], [41.90, -87.64]]], 'distances': [1.04] }
+    assert routeFingerprint(route) == routeFingerprint(nearby)
+    assert routeFingerprint(route) != routeFingerprint(other)
@@ -0,0 +1,42 @@
+import random
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+pytest.importorskip("pytz")
+suntime = pytest.importorskip("suntime")
+pytest.importorskip("requests")
+
+from astronomy import is_night, season_vector
+from calculations import get_season
+
+# is_night reads sunrise/sunset for the center of a 0.25 degree cell on the same calendar day of a
+# reference year, so it may disagree with suntime at the exact point only this close to sunrise/sunset
+TOLERANCE_MINUTES = 2
+
+
+@pytest.mark.parametrize("year", [2019, 2020, 2021])
+def test_season_vector_matches_get_season(year):
+    day = datetime(year, 1, 1, 12, 30)
+    while day.year == year:
+        assert season_vector(day) == get_season(day.strftime("%a, %d %b %Y %H:%M:%S ")), day
+        day += timedelta(days=1)
+
+
+def test_season_vector_uses_local_date_of_aware_datetimes():
+    moment = datetime(2021, 3, 20, 23, 30, tzinfo=timezone.utc)  # doy 79 (winter), doy 80 would be spring
+    assert season_vector(moment) == get_season(moment.strftime("%a, %d %b %Y %H:%M:%S ")) == [0, 0, 0]
+
+
+def test_is_night_matches_suntime_away_from_sunrise_and_sunset():
+    rng = random.Random(6242)
+    for _ in range(300):
+        lat, lon = rng.uniform(25, 49), rng.uniform(-124, -67)
+        moment = datetime(2021, 1, 1, tzinfo=timezone.utc) + timedelta(seconds=rng.uniform(0, 365 * 86400))
+        sun = suntime.Sun(lat, lon)
+        sunrise, sunset = sun.get_sunrise_time(moment.date()), sun.get_sunset_time(moment.date())
+        expected = 0 if sunrise < moment < sunset else 1
+
+        if is_night(lat, lon, moment) != expected:
+            nearest = min(abs((moment - sunrise).total_seconds()), abs((moment - sunset).total_seconds()))
+            assert nearest <= TOLERANCE_MINUTES * 60, (lat, lon, moment, sunrise, sunset)
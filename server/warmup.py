@@ -0,0 +1,132 @@
+import os
+import threading
+import time
+
+from calculations import get_current_conditions, weather_cell
+from astronomy import get_sun_table
+from spatial import ACCIDENT_GEOG, DEFAULT_RADIUS_M
+
+# Startup warmup: checks the pooled DB connections, pulls the hottest clusters'
+# index and heap pages into the PostGIS buffer cache, and pre-fetches weather and
+# sunrise/sunset tables for the grid cells around them, so the first real
+# requests don't pay for it.
+
+HOT_CLUSTER_COUNT = 200 # clusters whose accidents are read into the buffer cache
+HOT_CLUSTER_BATCH = 20 # clusters read per pooled connection checkout, so warmup never holds one for long
+WEATHER_CELL_COUNT = int(os.environ.get('WARMUP_WEATHER_CELLS', 5)) # paid API calls per worker on every boot, keep small
+PREWARM_RELATIONS = ['clusters_centroid_geog_idx', 'accidents_startloc_geog_idx', 'clusters']
+
+##
+# Tracks warmup progress so the readiness endpoint can report it.
+#
+class WarmupState:
+	def __init__(self, processStartTime):
+		self.processStartTime = processStartTime
+		self.ready = False
+		self.error = None
+		self.warnings = {}
+		self.steps = {}
+		self.coldStartSeconds = None
+
+	def step(self, name, fn):
+		start = time.time()
+		result = fn()
+		self.steps[name] = round(time.time() - start, 3)
+		print(f"[warmup] {name}: {self.steps[name]}s")
+		return result
+
+	##
+	# Runs a step that only saves work for the first requests, a failure is recorded as a warning and warmup carries on.
+	#
+	def optionalStep(self, name, fn):
+		try:
+			return self.step(name, fn)
+		except Exception as err:
+			print(f"[warmup] {name} skipped: {err}")
+			self.warnings[name] = str(err)
+
+	@property
+	def healthy(self):
+		return self.ready and self.error is None
+
+	def report(self):
+		status = 'failed' if self.error is not None else ('ready' if self.ready else 'warming')
+		return { 'status': status, 'ready': self.healthy, 'error': self.error, 'warnings': self.warnings, 'steps': self.steps, 'coldStartSeconds': self.coldStartSeconds }
+
+##
+# Runs a trivial query through the pool. The pool opens all its connections when it is created,
+# so this only checks they work; it never holds more than one connection.
+#
+def checkPool(getCursor):
+	with getCursor() as cur:
+		cur.execute('SELECT 1')
+		cur.fetchall()
+
+##
+# Loads the spatial indexes into shared buffers with pg_prewarm when available.
+# The extension needs elevated privileges, so a failure here is not fatal.
+#
+def prewarmRelations(cur):
+	try:
+		for relation in PREWARM_RELATIONS:
+			cur.execute('SELECT pg_prewarm(%s)', (relation,))
+	except Exception as err:
+		print(f"[warmup] pg_prewarm unavailable: {err}")
+
+##
+# Reads the accidents around the hottest clusters, which pulls their pages into the buffer cache.
+# Clusters are ranked by severity straight from the clusters table, so no worker scans accidents_table to rank them.
+# Output: list of (cluster_id, lat, lon) for the hottest clusters, hottest first
+#
+def prewarmHotClusters(getCursor, count):
+	with getCursor() as cur:
+		cur.execute('SELECT cluster_id, ST_Y(centroid), ST_X(centroid) FROM clusters ORDER BY severity DESC LIMIT %s', (count,))
+		hot = cur.fetchall()
+
+	for start in range(0, len(hot), HOT_CLUSTER_BATCH):
+		with getCursor() as cur:
+			for clusterId, lat, lon in hot[start:start + HOT_CLUSTER_BATCH]:
+				cur.execute(f"SELECT count(*) FROM accidents_table WHERE ST_DWithin({ACCIDENT_GEOG}, ST_MakePoint(%s, %s)::geography, %s)", (lon, lat, DEFAULT_RADIUS_M * 20))
+				cur.fetchall()
+	return hot
+
+##
+# Pre-fetches current weather for the first count distinct cells among the given points.
+#
+def prefetchWeather(points, count):
+	cells = set()
+	for lat, lon in points:
+		cell = weather_cell(lat, lon)
+		if cell in cells:
+			continue
+		cells.add(cell)
+		get_current_conditions(lat, lon)
+		if len(cells) >= count:
+			break
+	return len(cells)
+
+##
+# Runs every warmup step in order, then marks the state as ready.
+# A failed pool or database step is recorded on the state, and /ready keeps reporting unhealthy.
+# Weather and sun tables are fetched on demand anyway, so their failures (rate limits, timeouts) are only warnings.
+#
+def warmUp(state, getCursor):
+	try:
+		state.step('pool', lambda: checkPool(getCursor))
+		with getCursor() as cur:
+			state.step('relations', lambda: prewarmRelations(cur))
+		hot = state.step('clusters', lambda: prewarmHotClusters(getCursor, HOT_CLUSTER_COUNT))
+		state.optionalStep('weather', lambda: prefetchWeather([(lat, lon) for _, lat, lon in hot], WEATHER_CELL_COUNT))
+		state.optionalStep('sun', lambda: [get_sun_table(lat, lon) for _, lat, lon in hot[:WEATHER_CELL_COUNT]])
+	except Exception as err:
+		print(f"[warmup] failed: {err}")
+		state.error = str(err)
+
+	state.coldStartSeconds = round(time.time() - state.processStartTime, 3)
+	state.ready = True
+	print(f"[warmup] {state.report()['status']}, cold start took {state.coldStartSeconds}s")
+
+def startWarmUp(state, getCursor):
+	thread = threading.Thread(target=warmUp, args=(state, getCursor), daemon=True)
+	thread.start()
+	return thread